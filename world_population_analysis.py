@@ -0,0 +1,491 @@
+"""Build the interactive world population maps for the site.
+
+Reads ``data/world_population.csv`` (World Bank wide format: one row per
+country, one column per year) together with ``data/world-countries.json``
+and renders three artifacts into ``output/``:
+
+* a choropleth of the most recent year's population,
+* a DBSCAN "hotspot" overlay of high-population country centroids,
+* a per-continent population time-series plot.
+
+Run ``python world_population_analysis.py`` to regenerate everything.
+"""
+
+import argparse
+import concurrent.futures
+import json
+import os
+import subprocess
+
+import folium
+import folium.plugins
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import plotly.express as px
+import pycountry_convert as pc
+import shapely
+from sklearn.cluster import DBSCAN
+from sklearn.neighbors import NearestNeighbors, sort_graph_by_row_values
+
+try:
+    from numba import njit, prange
+except ImportError:
+    njit = prange = None
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = os.path.join(BASE_DIR, "data")
+OUTPUT_DIR = os.path.join(BASE_DIR, "output")
+POPULATION_CSV_PATH = os.path.join(DATA_DIR, "world_population.csv")
+GEOJSON_PATH = os.path.join(DATA_DIR, "world-countries.json")
+TILES_DIR = os.path.join(OUTPUT_DIR, "tiles")
+
+# Countries above this population are considered for hotspot clustering.
+POPULATION_THRESHOLD = 50_000_000
+
+# DBSCAN neighborhood radius for hotspot clustering, in kilometers.
+HOTSPOT_EPS_KM = 1500
+EARTH_RADIUS_KM = 6371.0088
+HOTSPOT_MIN_SAMPLES = 3
+
+# Below this many points sklearn is fast enough; above it the compiled
+# kernel avoids the Python-level overhead (only used if numba is present).
+NUMBA_DBSCAN_MIN_POINTS = 10_000
+
+# Past this many markers, hand aggregation to Leaflet's marker clusterer
+# instead of drawing every point at every zoom.
+DENSE_MARKER_THRESHOLD = 500
+
+# 6-class YlOrRd ramp, matching the inline Choropleth's fill_color.
+YLORRD_COLORS = ["#ffffb2", "#fed976", "#feb24c", "#fd8d3c", "#f03b20", "#bd0026"]
+
+# CSV country names that do not match the GeoJSON "name" property.
+COUNTRY_NAME_MAP = {
+    "United States": "United States of America",
+    "Russian Federation": "Russia",
+    "Iran, Islamic Rep.": "Iran",
+    "Egypt, Arab Rep.": "Egypt",
+    "Congo, Dem. Rep.": "Democratic Republic of the Congo",
+    "Congo, Rep.": "Republic of the Congo",
+    "Venezuela, RB": "Venezuela",
+    "Korea, Rep.": "South Korea",
+    "Korea, Dem. People's Rep.": "North Korea",
+    "Tanzania": "United Republic of Tanzania",
+    "Serbia": "Republic of Serbia",
+    "Syrian Arab Republic": "Syria",
+    "Yemen, Rep.": "Yemen",
+    "Lao PDR": "Laos",
+    "Slovak Republic": "Slovakia",
+    "Czechia": "Czech Republic",
+    "Turkiye": "Turkey",
+    "Kyrgyz Republic": "Kyrgyzstan",
+    "Viet Nam": "Vietnam",
+    "Brunei Darussalam": "Brunei",
+    "Cote d'Ivoire": "Ivory Coast",
+}
+
+# Lazily detected year columns; see _year_columns(). Importing the module
+# must not touch the data files.
+_YEAR_COLS = None
+
+
+def _year_columns():
+    """Return the year columns of the population CSV (cached header read)."""
+    global _YEAR_COLS
+    if _YEAR_COLS is None:
+        header = pd.read_csv(POPULATION_CSV_PATH, nrows=0).columns
+        _YEAR_COLS = [c for c in header if c.isdigit()]
+    return _YEAR_COLS
+
+
+def _recent_year():
+    """Return the most recent year available in the population CSV."""
+    return max(_year_columns())
+
+
+def get_continent(country_name):
+    """Return the continent name for ``country_name``, or ``"Unknown"``."""
+    try:
+        alpha2 = pc.country_name_to_country_alpha2(country_name)
+        continent_code = pc.country_alpha2_to_continent_code(alpha2)
+        return pc.convert_continent_code_to_continent_name(continent_code)
+    except (KeyError, TypeError):
+        return "Unknown"
+
+
+def load_and_preprocess_data():
+    """Load the population table and join it onto the country polygons.
+
+    Returns ``(merged_gdf, pop_df)`` — the GeoDataFrame with a
+    ``population`` column for the most recent year, and the full wide
+    population frame for the time-series plot.
+    """
+    # The pyarrow engine parses the wide numeric CSV with multiple threads;
+    # the header probe in _year_columns stays on the C engine since
+    # pyarrow does not support nrows.
+    pop_df = pd.read_csv(
+        POPULATION_CSV_PATH,
+        usecols=["Country Name"] + _year_columns(),
+        dtype={c: "Float32" for c in _year_columns()},
+        engine="pyarrow",
+    )
+    pop_df = pop_df.rename(columns={"Country Name": "country"})
+
+    # Reuse the merged layer from a GeoParquet cache when neither source
+    # file changed since it was written; the key folds in both mtimes so
+    # a stale cache is simply never hit.
+    cache_key = hash(
+        (os.path.getmtime(POPULATION_CSV_PATH), os.path.getmtime(GEOJSON_PATH))
+    ) & 0xFFFFFFFFFFFFFFFF
+    cache_path = os.path.join(OUTPUT_DIR, f"merged_{cache_key:016x}.parquet")
+    if os.path.exists(cache_path):
+        return gpd.read_parquet(cache_path), pop_df
+
+    # Assemble the two columns straight from a notna mask rather than
+    # copy -> dropna -> astype, which materializes the slice twice.
+    recent_year = _recent_year()
+    mask = pop_df[recent_year].notna()
+    pop_recent = pd.DataFrame(
+        {
+            "country": pop_df.loc[mask, "country"].to_numpy(),
+            # int32 comfortably holds any national population and halves
+            # the bytes moved through the merge and serialization.
+            "population": pop_df.loc[mask, recent_year].to_numpy(dtype=np.int32),
+        }
+    )
+    # Remap names on the ~200 categories instead of scanning every row
+    # with .replace(); the column stays categorical for the cheap merge.
+    pop_recent["country"] = pd.Categorical(pop_recent["country"]).rename_categories(
+        lambda c: COUNTRY_NAME_MAP.get(c, c)
+    )
+
+    world_gdf = gpd.read_file(GEOJSON_PATH)
+    world_gdf = world_gdf.rename(columns={"name": "country"})
+    # Single-column join: a dict-backed .map() is one vectorized hash
+    # lookup per row, with none of merge()'s frame reallocation.
+    pop_map = dict(zip(pop_recent["country"], pop_recent["population"]))
+    world_gdf["population"] = world_gdf["country"].map(pop_map).fillna(0).astype("int32")
+    merged_gdf = world_gdf
+
+    # The choropleth serializes every vertex into the output HTML, so trim
+    # the polygons first: snap coordinates to ~1e-5 degrees (about a meter)
+    # and simplify with a 0.05-degree tolerance.
+    merged_gdf["geometry"] = shapely.set_precision(merged_gdf.geometry.values, 1e-5)
+    merged_gdf["geometry"] = merged_gdf.geometry.simplify(0.05, preserve_topology=True)
+
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    merged_gdf.to_parquet(cache_path)
+    return merged_gdf, pop_df
+
+
+def build_vector_tiles(merged_gdf):
+    """Pre-tile the merged countries layer into ``output/tiles/``.
+
+    Runs tippecanoe (must be on PATH) over the merged GeoJSON, producing a
+    static z/x/y directory of uncompressed Mapbox vector tiles carrying the
+    ``population`` property. Run with ``--build-tiles`` before publishing so
+    the map can serve tiles instead of inlining the full GeoJSON.
+    """
+    subprocess.run(
+        [
+            "tippecanoe",
+            "--output-to-directory",
+            TILES_DIR,
+            "--layer",
+            "countries",
+            "--no-tile-compression",
+            "--coalesce-densest-as-needed",
+            "-zg",
+            "--force",
+        ],
+        input=merged_gdf.to_json().encode(),
+        check=True,
+    )
+
+
+def create_choropleth_map(merged_gdf, use_tiles=False):
+    """Render the recent-year population choropleth and return the map.
+
+    With ``use_tiles=True``, serve the pre-built vector tiles from
+    ``output/tiles/`` instead of inlining the GeoJSON (run ``--build-tiles``
+    first); the tile style reproduces the choropleth's YlOrRd binning from
+    the ``population`` property carried in the tiles.
+    """
+    world_map = folium.Map(location=[20, 0], zoom_start=2, tiles="cartodbpositron")
+    if use_tiles:
+        if not os.path.isdir(TILES_DIR):
+            raise FileNotFoundError(
+                f"no vector tiles at {TILES_DIR}; run with --build-tiles first"
+            )
+        # Same equal-width bins folium.Choropleth derives for the inline
+        # layer, applied client-side per feature.
+        bin_edges = np.linspace(
+            merged_gdf["population"].min(),
+            merged_gdf["population"].max(),
+            len(YLORRD_COLORS) + 1,
+        )[1:-1]
+        style_js = folium.JsCode(
+            f"""
+            function (properties, zoom) {{
+                var bins = {json.dumps(bin_edges.tolist())};
+                var colors = {json.dumps(YLORRD_COLORS)};
+                var population = properties.population || 0;
+                var i = 0;
+                while (i < bins.length && population > bins[i]) {{ i++; }}
+                return {{
+                    weight: 0.5,
+                    color: "#444444",
+                    fill: true,
+                    fillColor: colors[i],
+                    fillOpacity: 0.7
+                }};
+            }}
+            """
+        )
+        folium.plugins.VectorGridProtobuf(
+            "tiles/{z}/{x}/{y}.pbf",
+            name=f"Population ({_recent_year()})",
+            options={"vectorTileLayerStyles": {"countries": style_js}},
+        ).add_to(world_map)
+        return world_map
+    folium.Choropleth(
+        geo_data=merged_gdf.to_json(),
+        data=merged_gdf,
+        columns=["country", "population"],
+        key_on="feature.properties.country",
+        fill_color="YlOrRd",
+        fill_opacity=0.7,
+        line_opacity=0.2,
+        nan_fill_color="lightgray",
+        legend_name=f"Population ({_recent_year()})",
+    ).add_to(world_map)
+    return world_map
+
+
+if njit is not None:
+
+    @njit(parallel=True, fastmath=True, cache=True)
+    def _haversine_dbscan(lat, lon, eps_rad, min_pts):
+        """Numba DBSCAN over (lat, lon) radians with great-circle distance.
+
+        Returns labels like sklearn's DBSCAN: cluster ids from 0, noise -1.
+        """
+        n = lat.shape[0]
+        # Parallel pass 1: neighborhood sizes per point.
+        counts = np.zeros(n, np.int64)
+        for i in prange(n):
+            c = 0
+            for j in range(n):
+                dlat = lat[j] - lat[i]
+                dlon = lon[j] - lon[i]
+                a = (
+                    np.sin(dlat / 2.0) ** 2
+                    + np.cos(lat[i]) * np.cos(lat[j]) * np.sin(dlon / 2.0) ** 2
+                )
+                if 2.0 * np.arcsin(np.sqrt(a)) <= eps_rad:
+                    c += 1
+            counts[i] = c
+        # Parallel pass 2: fill CSR-style neighbor lists.
+        offsets = np.zeros(n + 1, np.int64)
+        for i in range(n):
+            offsets[i + 1] = offsets[i] + counts[i]
+        neighbors = np.empty(offsets[n], np.int64)
+        for i in prange(n):
+            k = offsets[i]
+            for j in range(n):
+                dlat = lat[j] - lat[i]
+                dlon = lon[j] - lon[i]
+                a = (
+                    np.sin(dlat / 2.0) ** 2
+                    + np.cos(lat[i]) * np.cos(lat[j]) * np.sin(dlon / 2.0) ** 2
+                )
+                if 2.0 * np.arcsin(np.sqrt(a)) <= eps_rad:
+                    neighbors[k] = j
+                    k += 1
+        # Serial pass 3: expand clusters from core points.
+        labels = np.full(n, -1, np.int64)
+        visited = np.zeros(n, np.bool_)
+        stack = np.empty(n, np.int64)
+        cluster = 0
+        for i in range(n):
+            if visited[i] or counts[i] < min_pts:
+                continue
+            visited[i] = True
+            labels[i] = cluster
+            top = 0
+            stack[top] = i
+            top += 1
+            while top > 0:
+                top -= 1
+                p = stack[top]
+                for idx in range(offsets[p], offsets[p + 1]):
+                    q = neighbors[idx]
+                    if labels[q] == -1:
+                        labels[q] = cluster
+                    if not visited[q] and counts[q] >= min_pts:
+                        visited[q] = True
+                        stack[top] = q
+                        top += 1
+            cluster += 1
+        return labels
+
+
+def perform_hotspot_analysis(merged_gdf, folium_map):
+    """Cluster high-population countries and draw their centroids on the map."""
+    hotspot_gdf = merged_gdf[merged_gdf["population"] > POPULATION_THRESHOLD].copy()
+    if hotspot_gdf.empty:
+        return folium_map
+
+    # Vectorized centroid extraction via shapely 2.0 ufuncs: one GEOS call
+    # over the whole geometry array instead of N Python attribute lookups.
+    centroids = shapely.centroid(hotspot_gdf.geometry.values)
+    coords = np.column_stack([shapely.get_y(centroids), shapely.get_x(centroids)])
+    hotspot_gdf["centroid"] = gpd.GeoSeries(
+        centroids, index=hotspot_gdf.index, crs=hotspot_gdf.crs
+    )
+
+    # Cluster on great-circle distance: haversine expects (lat, lon) in
+    # radians. Build the eps-neighborhood graph once through a ball tree
+    # (O(n log n) and sparse), so DBSCAN never touches a dense distance
+    # matrix — this keeps the step cheap if the layer ever grows beyond
+    # countries to admin-level features.
+    eps_rad = HOTSPOT_EPS_KM / EARTH_RADIUS_KM
+    coords_rad = np.radians(coords)
+    if njit is not None and len(coords_rad) >= NUMBA_DBSCAN_MIN_POINTS:
+        labels = _haversine_dbscan(
+            coords_rad[:, 0].copy(),
+            coords_rad[:, 1].copy(),
+            eps_rad,
+            HOTSPOT_MIN_SAMPLES,
+        )
+    else:
+        neighbor_graph = (
+            NearestNeighbors(metric="haversine", algorithm="ball_tree")
+            .fit(coords_rad)
+            .radius_neighbors_graph(radius=eps_rad, mode="distance")
+        )
+        # DBSCAN expects precomputed sparse rows sorted by distance. Make
+        # the diagonal explicit first: DBSCAN's own setdiag would insert
+        # the zeros in column order and un-sort the rows, and an
+        # all-isolated graph with no stored entries would crash the sort.
+        neighbor_graph.setdiag(0)
+        neighbor_graph = sort_graph_by_row_values(
+            neighbor_graph, warn_when_not_sorted=False
+        )
+        labels = DBSCAN(
+            eps=eps_rad, min_samples=HOTSPOT_MIN_SAMPLES, metric="precomputed"
+        ).fit(neighbor_graph).labels_
+    hotspot_gdf["cluster"] = labels
+    num_clusters = len(set(labels)) - (1 if -1 in labels else 0)
+
+    # Tile the palette so more clusters than base colors wraps around
+    # instead of indexing past the end, and look colors up through a
+    # numpy array rather than re-slicing the list per marker.
+    palette = px.colors.qualitative.Bold
+    color_lookup = np.array((palette * (num_clusters // len(palette) + 1))[:num_clusters])
+
+    # One flat pass over plain numpy arrays: filter out the -1 noise label
+    # once, then index columns positionally instead of boxing each row
+    # into a Series with iterrows(). All markers go into a single GeoJSON
+    # FeatureCollection so the page carries one Leaflet layer instead of
+    # one script snippet per marker.
+    clustered = hotspot_gdf[hotspot_gdf["cluster"] >= 0]
+    if clustered.empty:
+        # All points labeled noise: nothing to draw, and GeoJsonTooltip
+        # rejects an empty FeatureCollection at render time.
+        return folium_map
+    ys = shapely.get_y(clustered["centroid"].values)
+    xs = shapely.get_x(clustered["centroid"].values)
+    cluster_ids = clustered["cluster"].to_numpy()
+    names = clustered["country"].to_numpy()
+    features = [
+        {
+            "type": "Feature",
+            "geometry": {"type": "Point", "coordinates": [float(xs[i]), float(ys[i])]},
+            "properties": {
+                "country": str(names[i]),
+                "cluster": int(cluster_ids[i]),
+                "color": str(color_lookup[cluster_ids[i]]),
+            },
+        }
+        for i in range(len(clustered))
+    ]
+    hotspot_layer = folium.GeoJson(
+        {"type": "FeatureCollection", "features": features},
+        name="Population hotspots",
+        marker=folium.CircleMarker(radius=6, fill=True, fill_opacity=0.8),
+        style_function=lambda feature: {"color": feature["properties"]["color"]},
+        tooltip=folium.GeoJsonTooltip(fields=["country", "cluster"]),
+    )
+    if len(features) > DENSE_MARKER_THRESHOLD:
+        # Dense output: let the client-side clusterer aggregate markers
+        # per zoom level rather than rendering them all at once.
+        parent = folium.plugins.MarkerCluster(name="Population hotspots")
+        parent.add_to(folium_map)
+        hotspot_layer.add_to(parent)
+    else:
+        hotspot_layer.add_to(folium_map)
+    return folium_map
+
+
+def create_time_series_plot(pop_df):
+    """Plot total population per continent over time to an HTML file."""
+    # Resolve each distinct country once; pycountry_convert goes through a
+    # Python-level lookup (and an expensive exception path on misses), so
+    # avoid repeating it for every row.
+    continent_map = {c: get_continent(c) for c in pop_df["country"].unique()}
+    pop_df["continent"] = pop_df["country"].map(continent_map)
+
+    # Aggregate on the wide frame and only then reshape: summing the year
+    # columns per continent first keeps the intermediate at
+    # (continents x years) instead of melting out country x year rows.
+    year_cols = [c for c in pop_df.columns if c.isdigit()]
+    wide_sum = pop_df.groupby("continent")[year_cols].sum(min_count=1)
+    continent_ts = (
+        wide_sum.stack()
+        .rename("population")
+        .reset_index()
+        .rename(columns={"level_1": "year"})
+    )
+    continent_ts["year"] = pd.to_numeric(continent_ts["year"])
+
+    fig = px.line(
+        continent_ts[continent_ts["continent"] != "Unknown"],
+        x="year",
+        y="population",
+        color="continent",
+        title="World population by continent",
+    )
+    fig.write_html(os.path.join(OUTPUT_DIR, "population_timeseries.html"))
+
+
+def main(build_tiles=False, use_tiles=False):
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    merged_gdf, full_pop_df = load_and_preprocess_data()
+    if build_tiles:
+        build_vector_tiles(merged_gdf)
+        use_tiles = True
+    # The time-series branch only needs the wide population frame, so it
+    # runs in a worker process while the maps render here.
+    with concurrent.futures.ProcessPoolExecutor(max_workers=1) as executor:
+        ts_future = executor.submit(create_time_series_plot, full_pop_df)
+        world_map = create_choropleth_map(merged_gdf, use_tiles=use_tiles)
+        perform_hotspot_analysis(merged_gdf, world_map)
+        world_map.save(os.path.join(OUTPUT_DIR, "world_population_map.html"))
+        ts_future.result()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--build-tiles",
+        action="store_true",
+        help="pre-build vector tiles with tippecanoe and render from them",
+    )
+    parser.add_argument(
+        "--use-tiles",
+        action="store_true",
+        help="render the country layer from previously built vector tiles",
+    )
+    args = parser.parse_args()
+    main(build_tiles=args.build_tiles, use_tiles=args.use_tiles)